@@ -1,16 +1,28 @@
+import asyncio
+import hashlib
 import io
 import os
-from datetime import datetime, timedelta, timezone
+import re
+import tempfile
+import textwrap
+import time
+from collections import OrderedDict, defaultdict, deque
+from datetime import datetime, timedelta, timezone, tzinfo
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import IO, Any, DefaultDict, Deque, Dict, Hashable, Iterator, List, Optional, Tuple
 
 import google.generativeai as genai
-import requests
+import httpx
+import redis.asyncio as redis
+from anyio import to_thread
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from PIL import Image
 from pydantic import BaseModel
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.utils import ImageReader
@@ -22,10 +34,34 @@ ENV_FILE = BACKEND_DIR / ".env"
 
 load_dotenv(dotenv_path=ENV_FILE)
 
-app = FastAPI(title="ViajeIA API", description="Backend para el asistente de viajes")
+app = FastAPI(
+    title="ViajeIA API",
+    description="Backend para el asistente de viajes",
+    default_response_class=ORJSONResponse,
+)
 
 BASE_DIR = Path(__file__).resolve().parents[2]
 FRONTEND_DIST = BASE_DIR / "frontend" / "dist"
+PDF_SPOOL_MAX_SIZE = 1_000_000
+PDF_LINE_HEIGHT = 14
+PDF_BOTTOM_MARGIN = 80
+THREADPOOL_MAX_WORKERS = 16
+HISTORY_LIMIT = 10
+SESSION_TTL_SECONDS = 7 * 24 * 3600
+
+PROMPT_PREFIX = (
+    "Preséntate siempre como 'Alex, tu consultor personal de viajes'. "
+    "Mantén un tono entusiasta y amigable, utiliza emojis relacionados con viajes "
+    "✈️ 🌍 🧳. Antes de recomendar, incluye 1-2 preguntas para conocer mejor las "
+    "preferencias (presupuesto, intereses, ritmo del viaje). "
+    "La respuesta siempre debe seguir exactamente este formato (usa bullets donde aplique):\n"
+    "» ALOJAMIENTO: ...\n"
+    "Þ COMIDA LOCAL: ...\n"
+    " LUGARES IMPERDIBLES: ...\n"
+    "ä CONSEJOS LOCALES: ...\n"
+    "ø ESTIMACIÓN DE COSTOS: ...\n"
+    "Si falta información, solicita más detalles dentro de la sección correspondiente. "
+)
 
 origins = [
     "http://localhost:5173",
@@ -43,6 +79,62 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+async def startup_http_client():
+    app.state.http_client = httpx.AsyncClient(
+        timeout=8.0,
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+    )
+
+
+@app.on_event("startup")
+async def startup_thread_limiter():
+    to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_MAX_WORKERS
+
+
+@app.on_event("startup")
+async def startup_gemini_model():
+    api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise RuntimeError("Falta la variable de entorno GEMINI_API_KEY o GOOGLE_API_KEY.")
+
+    genai.configure(api_key=api_key)
+    app.state.gemini_model_name = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+    app.state.gemini_model = genai.GenerativeModel(app.state.gemini_model_name)
+
+
+@app.on_event("startup")
+async def startup_session_store():
+    redis_url = os.getenv("REDIS_URL")
+    if redis_url:
+        app.state.session_store = RedisSessionStore(
+            redis.from_url(redis_url, decode_responses=True)
+        )
+    else:
+        app.state.session_store = MemorySessionStore()
+
+
+@app.on_event("startup")
+async def startup_home_timezone():
+    app.state.home_tz, app.state.home_tz_name = resolve_home_timezone()
+
+
+@app.on_event("startup")
+async def startup_index_html():
+    index_file = FRONTEND_DIST / "index.html"
+    app.state.index_html = index_file.read_bytes() if index_file.exists() else None
+
+
+@app.on_event("shutdown")
+async def shutdown_http_client():
+    await app.state.http_client.aclose()
+
+
+@app.on_event("shutdown")
+async def shutdown_session_store():
+    await app.state.session_store.close()
+
+
 class HistoryEntry(BaseModel):
     pregunta: str
     respuesta: Optional[str] = None
@@ -75,28 +167,149 @@ class PlanResponse(BaseModel):
     favorites: List[str] = []
 
 
-conversation_store: Dict[str, List[HistoryEntry]] = {}
-favorites_store: Dict[str, List[str]] = {}
+class MemorySessionStore:
+    def __init__(self):
+        self.conversations: DefaultDict[str, Deque[HistoryEntry]] = defaultdict(
+            lambda: deque(maxlen=HISTORY_LIMIT)
+        )
+        self.favorites: DefaultDict[str, Dict[str, None]] = defaultdict(dict)
+
+    async def get_history(self, session_id: str) -> List[HistoryEntry]:
+        return list(self.conversations.get(session_id, ()))
+
+    async def append_history(self, session_id: str, entry: HistoryEntry) -> List[HistoryEntry]:
+        history = self.conversations[session_id]
+        history.append(entry)
+        return list(history)
+
+    async def get_favorites(self, session_id: str) -> List[str]:
+        return list(self.favorites.get(session_id, ()))
+
+    async def add_favorite(self, session_id: str, destino: str) -> List[str]:
+        favorites = self.favorites[session_id]
+        favorites[destino] = None
+        return list(favorites)
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisSessionStore:
+    def __init__(self, client: redis.Redis):
+        self.client = client
+
+    async def get_history(self, session_id: str) -> List[HistoryEntry]:
+        raw_entries = await self.client.lrange(f"session:{session_id}:hist", 0, -1)
+        return [HistoryEntry.model_validate_json(raw) for raw in raw_entries]
+
+    async def append_history(self, session_id: str, entry: HistoryEntry) -> List[HistoryEntry]:
+        key = f"session:{session_id}:hist"
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.rpush(key, entry.model_dump_json())
+            pipe.ltrim(key, -HISTORY_LIMIT, -1)
+            pipe.expire(key, SESSION_TTL_SECONDS)
+            pipe.lrange(key, 0, -1)
+            *_, raw_entries = await pipe.execute()
+        return [HistoryEntry.model_validate_json(raw) for raw in raw_entries]
+
+    async def get_favorites(self, session_id: str) -> List[str]:
+        return await self.client.zrange(f"session:{session_id}:fav", 0, -1)
+
+    async def add_favorite(self, session_id: str, destino: str) -> List[str]:
+        key = f"session:{session_id}:fav"
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zadd(key, {destino: time.time()}, nx=True)
+            pipe.expire(key, SESSION_TTL_SECONDS)
+            pipe.zrange(key, 0, -1)
+            *_, favorites = await pipe.execute()
+        return favorites
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+class TTLCache:
+    def __init__(self, ttl_seconds: float, maxsize: int = 256, stale_ttl_seconds: float = 0):
+        self.ttl_seconds = ttl_seconds
+        self.stale_ttl_seconds = max(stale_ttl_seconds, ttl_seconds)
+        self.maxsize = maxsize
+        self._data: OrderedDict[Hashable, Tuple[float, float, Any]] = OrderedDict()
+
+    def _lookup(self, key: Hashable, allow_stale: bool) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        fresh_until, expires_at, value = item
+        now = time.monotonic()
+        if expires_at <= now:
+            del self._data[key]
+            return None
+        if fresh_until <= now and not allow_stale:
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def get(self, key: Hashable) -> Any:
+        return self._lookup(key, allow_stale=False)
+
+    def get_stale(self, key: Hashable) -> Any:
+        return self._lookup(key, allow_stale=True)
+
+    def set(self, key: Hashable, value: Any) -> None:
+        now = time.monotonic()
+        self._data[key] = (now + self.ttl_seconds, now + self.stale_ttl_seconds, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+
+weather_cache = TTLCache(ttl_seconds=900, stale_ttl_seconds=3 * 3600)
+photos_cache = TTLCache(ttl_seconds=86400, stale_ttl_seconds=7 * 86400)
+currency_cache = TTLCache(ttl_seconds=86400, stale_ttl_seconds=7 * 86400)
+exchange_rate_cache = TTLCache(ttl_seconds=3600, stale_ttl_seconds=86400)
+gemini_response_cache = TTLCache(ttl_seconds=3600, maxsize=512)
+pdf_image_cache = TTLCache(ttl_seconds=86400, maxsize=64)
+photo_tasks: Dict[str, "asyncio.Task[List[str]]"] = {}
+
+
+def gemini_cache_key(model_name: str, prompt: str) -> str:
+    normalized = f"{model_name}|{prompt.strip().lower()}"
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=32).hexdigest()
+
+
+FIELD_RE = re.compile(r"(?P<label>[^:\n|]+):\s*(?P<value>[^|\n]+)")
+
+
+@lru_cache(maxsize=512)
+def _parse_fields(text: str) -> Dict[str, str]:
+    fields: Dict[str, str] = {}
+    for match in FIELD_RE.finditer(text):
+        value = match.group("value").strip().strip(".")
+        if value:
+            fields.setdefault(match.group("label").strip(), value)
+    return fields
 
 
 def extract_field(text: str, label: str) -> Optional[str]:
-    marker = f"{label}:"
-    if marker not in text:
-        return None
-    segmento = text.split(marker, 1)[1]
-    posible = segmento.split("|", 1)[0].strip().strip(".")
-    return posible or None
+    return _parse_fields(text).get(label)
 
 
 def extract_destino(text: str) -> Optional[str]:
     return extract_field(text, "Destino deseado")
 
 
-def get_weather_data(destino: Optional[str]) -> Optional[dict]:
+async def get_weather_data(
+    client: httpx.AsyncClient, destino: Optional[str]
+) -> Optional[dict]:
     api_key = os.getenv("OPENWEATHER_API_KEY")
     if not api_key or not destino:
         return None
 
+    cache_key = destino.strip().lower()
+    cached = weather_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
     params = {
         "q": destino,
         "appid": api_key,
@@ -104,17 +317,18 @@ def get_weather_data(destino: Optional[str]) -> Optional[dict]:
         "lang": "es",
     }
     try:
-        response = requests.get(
-            "https://api.openweathermap.org/data/2.5/weather", params=params, timeout=8
+        response = await client.get(
+            "https://api.openweathermap.org/data/2.5/weather", params=params
         )
         response.raise_for_status()
         data = response.json()
-    except requests.RequestException:
-        return None
+    except (httpx.HTTPError, ValueError):
+        stale = weather_cache.get_stale(cache_key)
+        return {**stale, "stale": True} if stale is not None else None
 
     weather = data.get("weather", [{}])[0]
     main = data.get("main", {})
-    return {
+    weather_data = {
         "summary": weather.get("description", "").capitalize(),
         "temperature": main.get("temp"),
         "feels_like": main.get("feels_like"),
@@ -124,13 +338,22 @@ def get_weather_data(destino: Optional[str]) -> Optional[dict]:
         "timezone_offset": data.get("timezone"),
         "city": data.get("name") or destino,
     }
+    weather_cache.set(cache_key, weather_data)
+    return weather_data
 
 
-def get_destination_photos(destino: Optional[str]) -> List[str]:
+async def get_destination_photos(
+    client: httpx.AsyncClient, destino: Optional[str]
+) -> List[str]:
     api_key = os.getenv("UNSPLASH_ACCESS_KEY")
     if not api_key or not destino:
         return []
 
+    cache_key = destino.strip().lower()
+    cached = photos_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
     params = {
         "query": destino,
         "per_page": 3,
@@ -138,16 +361,15 @@ def get_destination_photos(destino: Optional[str]) -> List[str]:
     }
     headers = {"Accept-Version": "v1", "Authorization": f"Client-ID {api_key}"}
     try:
-        response = requests.get(
+        response = await client.get(
             "https://api.unsplash.com/search/photos",
             params=params,
             headers=headers,
-            timeout=8,
         )
         response.raise_for_status()
         data = response.json()
-    except requests.RequestException:
-        return []
+    except (httpx.HTTPError, ValueError):
+        return photos_cache.get_stale(cache_key) or []
 
     results = data.get("results", [])
     urls = []
@@ -155,32 +377,60 @@ def get_destination_photos(destino: Optional[str]) -> List[str]:
         url = item.get("urls", {}).get("regular")
         if url:
             urls.append(url)
+    if urls:
+        photos_cache.set(cache_key, urls)
     return urls
 
 
-def get_currency_code(country_code: Optional[str]) -> Optional[str]:
+def prefetch_destination_photos(
+    client: httpx.AsyncClient, destino: Optional[str]
+) -> "Optional[asyncio.Task[List[str]]]":
+    if not destino:
+        return None
+
+    task_key = destino.strip().lower()
+    task = photo_tasks.get(task_key)
+    if task is None:
+        task = asyncio.create_task(get_destination_photos(client, destino))
+        photo_tasks[task_key] = task
+        task.add_done_callback(lambda _: photo_tasks.pop(task_key, None))
+    return task
+
+
+async def get_currency_code(
+    client: httpx.AsyncClient, country_code: Optional[str]
+) -> Optional[str]:
     if not country_code:
         return None
+
+    cache_key = country_code.upper()
+    cached = currency_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
     try:
-        response = requests.get(
+        response = await client.get(
             f"https://restcountries.com/v3.1/alpha/{country_code}",
             params={"fields": "currencies"},
-            timeout=8,
         )
         response.raise_for_status()
         data = response.json()
-    except requests.RequestException:
-        return None
+    except (httpx.HTTPError, ValueError):
+        return currency_cache.get_stale(cache_key)
 
     if not data:
         return None
     currencies = data[0].get("currencies")
     if not currencies:
         return None
-    return next(iter(currencies.keys()))
+    currency_code = next(iter(currencies.keys()))
+    currency_cache.set(cache_key, currency_code)
+    return currency_code
 
 
-def get_exchange_rate(target_currency: Optional[str]) -> Optional[PanelSection]:
+async def get_exchange_rate(
+    client: httpx.AsyncClient, target_currency: Optional[str]
+) -> Optional[PanelSection]:
     if not target_currency:
         return None
     base_currency = os.getenv("HOME_CURRENCY", "USD").upper()
@@ -192,36 +442,50 @@ def get_exchange_rate(target_currency: Optional[str]) -> Optional[PanelSection]:
             description="La moneda local coincide con tu moneda base.",
         )
 
-    try:
-        response = requests.get(
-            f"https://open.er-api.com/v6/latest/{base_currency}", timeout=8
-        )
-        response.raise_for_status()
-        data = response.json()
-    except requests.RequestException:
-        return None
-
-    rate = data.get("rates", {}).get(target_currency)
+    cache_key = f"{base_currency}->{target_currency}"
+    rate = exchange_rate_cache.get(cache_key)
+    stale = False
     if rate is None:
-        return None
+        try:
+            response = await client.get(f"https://open.er-api.com/v6/latest/{base_currency}")
+            response.raise_for_status()
+            data = response.json()
+        except (httpx.HTTPError, ValueError):
+            rate = exchange_rate_cache.get_stale(cache_key)
+            if rate is None:
+                return None
+            stale = True
+        else:
+            rate = data.get("rates", {}).get(target_currency)
+            if rate is None:
+                return None
+            exchange_rate_cache.set(cache_key, rate)
 
+    description = (
+        "Tasa cacheada, open.er-api.com no responde en este momento"
+        if stale
+        else "Tasa en tiempo real cortesía de open.er-api.com"
+    )
     return PanelSection(
         label="Tipo de cambio",
         value=f"1 {base_currency} ≈ {rate:,.2f} {target_currency}",
-        description="Tasa en tiempo real cortesía de open.er-api.com",
+        description=description,
     )
 
 
-def get_time_difference_info(offset_seconds: Optional[int]) -> Optional[PanelSection]:
-    if offset_seconds is None:
-        return None
-
+def resolve_home_timezone() -> Tuple[tzinfo, str]:
     home_timezone_name = os.getenv("HOME_TIMEZONE", "UTC")
     try:
-        home_tz = ZoneInfo(home_timezone_name)
+        return ZoneInfo(home_timezone_name), home_timezone_name
     except Exception:
-        home_tz = timezone.utc
-        home_timezone_name = "UTC"
+        return timezone.utc, "UTC"
+
+
+def get_time_difference_info(
+    offset_seconds: Optional[int], home_tz: tzinfo, home_timezone_name: str
+) -> Optional[PanelSection]:
+    if offset_seconds is None:
+        return None
 
     home_now = datetime.now(home_tz)
     home_offset = home_now.utcoffset() or timedelta(0)
@@ -261,6 +525,8 @@ def format_weather_section(weather_data: Optional[dict]) -> Optional[PanelSectio
         description_parts.append(f"Sensación {feels:.0f} °C")
     if weather_data.get("humidity") is not None:
         description_parts.append(f"Humedad {weather_data['humidity']}%")
+    if weather_data.get("stale"):
+        description_parts.append("Dato cacheado")
 
     description = ". ".join(description_parts) if description_parts else None
 
@@ -271,35 +537,44 @@ def format_weather_section(weather_data: Optional[dict]) -> Optional[PanelSectio
     )
 
 
-def wrap_text(text: str, width: int = 90) -> List[str]:
-    words = text.split()
-    lines: List[str] = []
-    current = []
-    current_len = 0
-    for word in words:
-        if current_len + len(word) + (1 if current else 0) > width:
-            lines.append(" ".join(current))
-            current = [word]
-            current_len = len(word)
-        else:
-            current.append(word)
-            current_len += len(word) + (1 if current_len else 0)
-    if current:
-        lines.append(" ".join(current))
-    return lines or [text]
+def downscale_image(image_data: bytes, max_size: Tuple[int, int] = (360, 320)) -> bytes:
+    with Image.open(io.BytesIO(image_data)) as img:
+        img.thumbnail(max_size, Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        img.convert("RGB").save(output, "JPEG", quality=82, optimize=True)
+    return output.getvalue()
 
 
-def _get_gemini_model() -> genai.GenerativeModel:
-    api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise HTTPException(
-            status_code=500,
-            detail="Falta la variable de entorno GEMINI_API_KEY o GOOGLE_API_KEY.",
-        )
+async def get_pdf_images(client: httpx.AsyncClient, urls: List[str]) -> List[Optional[bytes]]:
+    images: Dict[str, Optional[bytes]] = {}
+    for url in dict.fromkeys(urls):
+        images[url] = pdf_image_cache.get(url)
 
-    genai.configure(api_key=api_key)
-    model_name = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
-    return genai.GenerativeModel(model_name)
+    pending = [url for url, image in images.items() if image is None]
+    responses = await asyncio.gather(
+        *(client.get(url, timeout=8) for url in pending),
+        return_exceptions=True,
+    )
+    for url, response in zip(pending, responses):
+        if isinstance(response, BaseException) or response.is_error:
+            continue
+        try:
+            images[url] = await run_in_threadpool(downscale_image, response.content)
+        except Exception:
+            continue
+        pdf_image_cache.set(url, images[url])
+
+    return [images[url] for url in urls]
+
+
+def wrap_text(text: str, width: int = 90) -> List[str]:
+    lines = textwrap.wrap(
+        " ".join(text.split()),
+        width=width,
+        break_long_words=False,
+        break_on_hyphens=False,
+    )
+    return lines or [text]
 
 
 @app.get("/api/health")
@@ -310,22 +585,26 @@ async def health_check():
 @app.post("/plan", response_model=PlanResponse)
 async def plan_trip(payload: PlanRequest):
     session_id = payload.session_id or "anon"
-    history_entries = conversation_store.get(session_id, [])
+    store = app.state.session_store
+    history_entries = await store.get_history(session_id)
 
-    model = _get_gemini_model()
+    model = app.state.gemini_model
     destino = extract_destino(payload.pregunta)
     if not destino and history_entries:
         destino = history_entries[-1].destino
 
-    weather_data = get_weather_data(destino)
-    fotos = get_destination_photos(destino)
+    client = app.state.http_client
+    prefetch_destination_photos(client, destino)
+    weather_data = await get_weather_data(client, destino)
 
     country_code = weather_data.get("country") if weather_data else None
-    currency_code = get_currency_code(country_code)
-    currency_section = get_exchange_rate(currency_code)
+    currency_code = await get_currency_code(client, country_code)
+    currency_section = await get_exchange_rate(client, currency_code)
 
     timezone_offset = weather_data.get("timezone_offset") if weather_data else None
-    time_section = get_time_difference_info(timezone_offset)
+    time_section = get_time_difference_info(
+        timezone_offset, app.state.home_tz, app.state.home_tz_name
+    )
 
     weather_section = format_weather_section(weather_data)
 
@@ -337,21 +616,7 @@ async def plan_trip(payload: PlanRequest):
         )
         history_text = f"\nHistorial reciente:\n{formatted}\n"
 
-    prompt = (
-        "Preséntate siempre como 'Alex, tu consultor personal de viajes'. "
-        "Mantén un tono entusiasta y amigable, utiliza emojis relacionados con viajes "
-        "✈️ 🌍 🧳. Antes de recomendar, incluye 1-2 preguntas para conocer mejor las "
-        "preferencias (presupuesto, intereses, ritmo del viaje). "
-        "La respuesta siempre debe seguir exactamente este formato (usa bullets donde aplique):\n"
-        "» ALOJAMIENTO: ...\n"
-        "Þ COMIDA LOCAL: ...\n"
-        " LUGARES IMPERDIBLES: ...\n"
-        "ä CONSEJOS LOCALES: ...\n"
-        "ø ESTIMACIÓN DE COSTOS: ...\n"
-        "Si falta información, solicita más detalles dentro de la sección correspondiente. "
-        f"Contexto del viajero: {payload.pregunta}"
-        f"{history_text}"
-    )
+    prompt_parts = [PROMPT_PREFIX, f"Contexto del viajero: {payload.pregunta}", history_text]
     if weather_data and destino:
         weather_bits = []
         if weather_data.get("summary"):
@@ -362,24 +627,30 @@ async def plan_trip(payload: PlanRequest):
             weather_bits.append(f"Humedad {weather_data['humidity']}%")
 
         if weather_bits:
-            prompt += (
-                f"\nInformación de clima actual para {destino}: "
-                + ", ".join(weather_bits)
+            prompt_parts.append(
+                f"\nInformación de clima actual para {destino}: " + ", ".join(weather_bits)
             )
-
-    try:
-        completion = model.generate_content(
-            [
-                "Actúa como planificador experto en viajes.",
-                prompt,
-            ]
-        )
-        respuesta = (completion.text or "").strip()
-    except Exception as exc:  # pragma: no cover - handled via HTTPException
-        raise HTTPException(
-            status_code=502,
-            detail=f"No pudimos obtener la recomendación de Gemini: {exc}",
-        ) from exc
+    prompt = "".join(prompt_parts)
+
+    cache_key = gemini_cache_key(app.state.gemini_model_name, prompt)
+    respuesta = gemini_response_cache.get(cache_key)
+    if respuesta is None:
+        try:
+            completion = await run_in_threadpool(
+                model.generate_content,
+                [
+                    "Actúa como planificador experto en viajes.",
+                    prompt,
+                ],
+            )
+            respuesta = (completion.text or "").strip()
+        except Exception as exc:  # pragma: no cover - handled via HTTPException
+            raise HTTPException(
+                status_code=502,
+                detail=f"No pudimos obtener la recomendación de Gemini: {exc}",
+            ) from exc
+        if respuesta:
+            gemini_response_cache.set(cache_key, respuesta)
 
     if not respuesta:
         respuesta = "No recibimos una respuesta clara, intenta describir un poco más tu viaje."
@@ -396,19 +667,30 @@ async def plan_trip(payload: PlanRequest):
         destino=destino,
         timestamp=datetime.utcnow().isoformat() + "Z",
     )
-    updated_history = history_entries + [entry]
-    conversation_store[session_id] = updated_history[-10:]
-    favorites = favorites_store.get(session_id, [])
+    history = await store.append_history(session_id, entry)
+    favorites = await store.get_favorites(session_id)
+    fotos = (photos_cache.get(destino.strip().lower()) if destino else None) or []
 
     return {
         "respuesta": respuesta,
         "fotos": fotos,
         "panel": panel,
-        "history": conversation_store[session_id],
+        "history": history,
         "favorites": favorites,
     }
 
 
+class PhotosResponse(BaseModel):
+    fotos: List[str]
+
+
+@app.get("/photos", response_model=PhotosResponse)
+async def list_photos(destino: str):
+    task = prefetch_destination_photos(app.state.http_client, destino)
+    fotos = await asyncio.shield(task) if task else []
+    return PhotosResponse(fotos=fotos)
+
+
 class FavoriteRequest(BaseModel):
     session_id: str
     destino: str
@@ -420,7 +702,7 @@ class FavoritesResponse(BaseModel):
 
 @app.get("/favorites", response_model=FavoritesResponse)
 async def list_favorites(session_id: str):
-    favorites = favorites_store.get(session_id, [])
+    favorites = await app.state.session_store.get_favorites(session_id)
     return FavoritesResponse(favorites=favorites)
 
 
@@ -432,29 +714,25 @@ async def save_favorite(payload: FavoriteRequest):
     if not session_id or not destino:
         raise HTTPException(status_code=400, detail="session_id y destino son obligatorios.")
 
-    favorites = favorites_store.setdefault(session_id, [])
-    if destino not in favorites:
-        favorites.append(destino)
-
+    favorites = await app.state.session_store.add_favorite(session_id, destino)
     return FavoritesResponse(favorites=favorites)
 
 
-@app.get("/itinerary/pdf")
-async def download_itinerary(session_id: str):
-    history = conversation_store.get(session_id)
-    if not history:
-        raise HTTPException(
-            status_code=404,
-            detail="No encontramos una conversación activa para generar el PDF.",
-        )
-
-    latest = history[-1]
-    destino = latest.destino or extract_destino(latest.pregunta) or "Destino no especificado"
-    fechas = extract_field(latest.pregunta, "Fechas aproximadas") or "Fechas no definidas"
-
-    photos = get_destination_photos(destino)
-
-    buffer = io.BytesIO()
+def iter_file_chunks(file_obj: IO[bytes], chunk_size: int = 65536) -> Iterator[bytes]:
+    try:
+        for chunk in iter(lambda: file_obj.read(chunk_size), b""):
+            yield chunk
+    finally:
+        file_obj.close()
+
+
+def build_itinerary_pdf(
+    history: List[HistoryEntry],
+    destino: str,
+    fechas: str,
+    images: List[Optional[bytes]],
+) -> IO[bytes]:
+    buffer = tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_MAX_SIZE)
     pdf = canvas.Canvas(buffer, pagesize=letter)
     width, height = letter
 
@@ -477,36 +755,43 @@ async def download_itinerary(session_id: str):
     pdf.drawString(40, y, "Resumen de la conversación")
     y -= 16
 
-    text = pdf.beginText(40, y)
-    text.setFont("Helvetica", 11)
+    all_lines: List[str] = []
     for entry in history:
-        text.textLine(f"• Pregunta: {entry.pregunta}")
+        all_lines.append(f"• Pregunta: {entry.pregunta}")
         if entry.respuesta:
-            for line in wrap_text(entry.respuesta):
-                text.textLine(f"  {line}")
-        text.textLine("")
-        if text.getY() < 80:
-            pdf.drawText(text)
-            pdf.showPage()
-            draw_header()
-            y = height - 120
-            pdf.setFont("Helvetica-Bold", 13)
-            pdf.drawString(40, y, "Resumen de la conversación (cont.)")
-            y -= 16
-            text = pdf.beginText(40, y)
-            text.setFont("Helvetica", 11)
-    pdf.drawText(text)
-
-    if photos:
+            all_lines.extend(f"  {line}" for line in wrap_text(entry.respuesta))
+        all_lines.append("")
+
+    start = 0
+    while True:
+        lines_per_page = int((y - PDF_BOTTOM_MARGIN) / PDF_LINE_HEIGHT) + 1
+        text = pdf.beginText(40, y)
+        text.setFont("Helvetica", 11, leading=PDF_LINE_HEIGHT)
+        for line in all_lines[start:start + lines_per_page]:
+            text.textLine(line)
+        pdf.drawText(text)
+
+        start += lines_per_page
+        if start >= len(all_lines):
+            break
+        pdf.showPage()
+        draw_header()
+        y = height - 120
+        pdf.setFont("Helvetica-Bold", 13)
+        pdf.drawString(40, y, "Resumen de la conversación (cont.)")
+        y -= 16
+
+    if images:
         pdf.showPage()
         draw_header()
         pdf.setFont("Helvetica-Bold", 13)
         pdf.drawString(40, height - 120, "Inspiración visual")
         x_positions = [40, width / 2 - 90, width - 220]
         y_photo = height - 320
-        for idx, url in enumerate(photos[:3]):
+        for idx, image_data in enumerate(images):
+            if image_data is None:
+                continue
             try:
-                image_data = requests.get(url, timeout=8).content
                 img = ImageReader(io.BytesIO(image_data))
                 pdf.drawImage(img, x_positions[idx], y_photo, width=180, height=160, preserveAspectRatio=True, mask='auto')
             except Exception:
@@ -515,10 +800,31 @@ async def download_itinerary(session_id: str):
     pdf.showPage()
     pdf.save()
     buffer.seek(0)
+    return buffer
+
+
+@app.get("/itinerary/pdf")
+async def download_itinerary(session_id: str):
+    history = await app.state.session_store.get_history(session_id)
+    if not history:
+        raise HTTPException(
+            status_code=404,
+            detail="No encontramos una conversación activa para generar el PDF.",
+        )
+
+    latest = history[-1]
+    destino = latest.destino or extract_destino(latest.pregunta) or "Destino no especificado"
+    fechas = extract_field(latest.pregunta, "Fechas aproximadas") or "Fechas no definidas"
+
+    client = app.state.http_client
+    photos = await asyncio.shield(prefetch_destination_photos(client, destino))
+    images = await get_pdf_images(client, photos[:3])
+
+    buffer = await run_in_threadpool(build_itinerary_pdf, history, destino, fechas, images)
 
     filename = f"viajeia-itinerario-{session_id[:8]}.pdf"
     return StreamingResponse(
-        buffer,
+        iter_file_chunks(buffer),
         media_type="application/pdf",
         headers={"Content-Disposition": f'attachment; filename="{filename}"'},
     )
@@ -530,11 +836,10 @@ if FRONTEND_DIST.exists():
 
 @app.get("/", response_class=HTMLResponse)
 async def serve_frontend():
-    if not FRONTEND_DIST.exists():
+    if app.state.index_html is None:
         raise HTTPException(
             status_code=503,
             detail="Build de frontend no encontrado. Ejecuta `npm run build` en frontend.",
         )
 
-    index_file = FRONTEND_DIST / "index.html"
-    return HTMLResponse(index_file.read_text(encoding="utf-8"))
+    return HTMLResponse(app.state.index_html)
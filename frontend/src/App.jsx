@@ -64,6 +64,19 @@ function App() {
     fetchFavorites()
   }, [sessionId, getApiUrl])
 
+  const fetchPhotos = async (photoDestino) => {
+    try {
+      const response = await fetch(
+        getApiUrl(`/photos?destino=${encodeURIComponent(photoDestino)}`)
+      )
+      if (!response.ok) return
+      const data = await response.json()
+      setFotos(Array.isArray(data.fotos) ? data.fotos : [])
+    } catch (err) {
+      console.warn('No pudimos cargar fotos del destino', err)
+    }
+  }
+
   const handleSubmit = async (event) => {
     event.preventDefault()
     if (!pregunta.trim()) {
@@ -101,11 +114,18 @@ function App() {
       }
 
       const data = await response.json()
+      const nextHistory = Array.isArray(data.history) ? data.history : []
+      const nextFotos = Array.isArray(data.fotos) ? data.fotos : []
       setRespuesta(data.respuesta ?? 'Sin respuesta disponible por ahora.')
-      setFotos(Array.isArray(data.fotos) ? data.fotos : [])
+      setFotos(nextFotos)
       setPanelInfo(data.panel ?? null)
-      setHistory(Array.isArray(data.history) ? data.history : [])
+      setHistory(nextHistory)
       setFavorites(Array.isArray(data.favorites) ? data.favorites : [])
+
+      const photoDestino = nextHistory[nextHistory.length - 1]?.destino
+      if (nextFotos.length === 0 && photoDestino) {
+        fetchPhotos(photoDestino)
+      }
     } catch (err) {
       setError(err.message)
     } finally {